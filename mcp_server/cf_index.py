@@ -0,0 +1,376 @@
+"""
+Indice incrementale per il Collaborative Filtering user-based
+Mantiene i rating in forma sparsa e le similarità aggiornate a ogni nuovo rating
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+# capacità iniziale degli aggregati per item, raddoppiata quando arrivano nuovi item
+INITIAL_CAPACITY = 64
+# numero massimo di righe di similarità tenute in cache (ognuna è lunga n_users)
+SIMILARITY_CACHE_SIZE = 256
+# peso del prior nello score bayesiano di popolarità (quanti rating "virtuali" pari alla media globale)
+POPULARITY_PRIOR_WEIGHT = 5.0
+# cifre decimali tenute per similarità e previsioni prima di ordinarle
+ROUND_DECIMALS = 12
+
+
+def _concat(arrays: List[np.ndarray], dtype) -> np.ndarray:
+    return np.concatenate(arrays) if arrays else np.zeros(0, dtype=dtype)
+
+
+class RatingIndex:
+    """Sparse user-item ratings with index maps and a bounded LRU cache of similarity rows."""
+
+    def __init__(self, ratings: Optional[pd.DataFrame] = None,
+                 similarity_cache_size: int = SIMILARITY_CACHE_SIZE):
+        # mappe id -> posizione (e inverse), estese in place per utenti/item nuovi
+        self.user_index: Dict[int, int] = {}
+        self.item_index: Dict[int, int] = {}
+        self.user_ids: List[int] = []
+        self.item_ids: List[int] = []
+
+        # rating in forma sparsa, salvati due volte: per riga (item valutati da ogni utente, tipo CSR)
+        # e per colonna (utenti che hanno valutato ogni item, tipo CSC), con le posizioni ordinate
+        self._user_cols: List[np.ndarray] = []
+        self._user_values: List[np.ndarray] = []
+        self._item_rows: List[np.ndarray] = []
+        self._item_values: List[np.ndarray] = []
+
+        # righe di similarità usate di recente; la memoria resta limitata a cache_size x n_users
+        # (almeno una riga viene sempre tenuta, così chiamate consecutive sullo stesso utente la riusano)
+        self.similarity_cache_size = similarity_cache_size
+        self._sim_cache: "OrderedDict[int, np.ndarray]" = OrderedDict()
+
+        # aggregati per item (numero e somma dei rating), aggiornati a ogni scrittura
+        self._item_count = np.zeros(INITIAL_CAPACITY)
+        self._item_sum = np.zeros(INITIAL_CAPACITY)
+        self._total_count = 0
+        self._total_sum = 0.0
+        # classifica di popolarità, riordinata alla prima richiesta dopo una scrittura
+        # (la media globale nel prior cambia a ogni rating, quindi cambiano tutti gli score)
+        self._popular_order: Optional[np.ndarray] = None
+        self._popular_scores: Optional[np.ndarray] = None
+        # tutte le voci (colonna, riga, rating) in array piatti, per le scansioni complete
+        # con vicinati densi; ricostruite in O(nnz) alla prima scansione dopo una scrittura
+        self._entries: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+
+        if ratings is not None and len(ratings) > 0:
+            self._load(ratings)
+
+    @property
+    def n_users(self) -> int:
+        return len(self.user_ids)
+
+    @property
+    def n_items(self) -> int:
+        return len(self.item_ids)
+
+    def _load(self, ratings: pd.DataFrame):
+        """Bulk-load a ratings DataFrame; for duplicate (user, item) pairs the last row wins."""
+        # ratings.csv è un log in append (add_rating accoda anche gli aggiornamenti): vale l'ultima riga
+        latest = (ratings.drop_duplicates(['user_id', 'item_id'], keep='last')
+                   .sort_values(['user_id', 'item_id']).reset_index(drop=True))
+
+        for user_id in latest['user_id'].unique():
+            self._add_user(int(user_id))
+        for item_id in np.sort(latest['item_id'].unique()):
+            self._add_item(int(item_id))
+
+        rows = latest['user_id'].map(self.user_index).to_numpy(dtype=np.int64)
+        cols = latest['item_id'].map(self.item_index).to_numpy(dtype=np.int64)
+        values = np.array(latest['rating'], dtype=float)
+
+        # latest è ordinato per (utente, item): divido in righe dove cambia l'utente
+        row_starts = np.flatnonzero(np.diff(rows)) + 1
+        for row, row_cols, row_values in zip(rows[np.r_[0, row_starts]],
+                                             np.split(cols, row_starts), np.split(values, row_starts)):
+            self._user_cols[row] = row_cols
+            self._user_values[row] = row_values
+
+        # stessa cosa per colonne, dopo aver riordinato per (item, utente)
+        order = np.lexsort((rows, cols))
+        cols_sorted, rows_sorted, values_sorted = cols[order], rows[order], values[order]
+        col_starts = np.flatnonzero(np.diff(cols_sorted)) + 1
+        for col, col_rows, col_values in zip(cols_sorted[np.r_[0, col_starts]],
+                                             np.split(rows_sorted, col_starts), np.split(values_sorted, col_starts)):
+            self._item_rows[col] = col_rows
+            self._item_values[col] = col_values
+
+        self._item_count[:self.n_items] = np.bincount(cols, minlength=self.n_items)
+        self._item_sum[:self.n_items] = np.bincount(cols, weights=values, minlength=self.n_items)
+        self._total_count = int(len(latest))
+        self._total_sum = float(values.sum())
+
+    def _add_user(self, user_id: int) -> int:
+        row = self.n_users
+        self.user_index[user_id] = row
+        self.user_ids.append(user_id)
+        self._user_cols.append(np.zeros(0, dtype=np.int64))
+        self._user_values.append(np.zeros(0))
+        return row
+
+    def _add_item(self, item_id: int) -> int:
+        col = self.n_items
+        # raddoppio la capacità degli aggregati quando non c'è più spazio
+        if col >= len(self._item_count):
+            self._item_count = np.concatenate([self._item_count, np.zeros(len(self._item_count))])
+            self._item_sum = np.concatenate([self._item_sum, np.zeros(len(self._item_sum))])
+        self.item_index[item_id] = col
+        self.item_ids.append(item_id)
+        self._item_rows.append(np.zeros(0, dtype=np.int64))
+        self._item_values.append(np.zeros(0))
+        return col
+
+    def has_user(self, user_id: int) -> bool:
+        return user_id in self.user_index
+
+    def user_ratings(self, user_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Item ids and ratings of user_id, sorted by item id (empty for unknown users)."""
+        row = self.user_index.get(user_id)
+        if row is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        item_ids = np.array([self.item_ids[c] for c in self._user_cols[row]], dtype=np.int64)
+        order = np.argsort(item_ids, kind='stable')
+        return item_ids[order], self._user_values[row][order]
+
+    # inserisco o aggiorno un valore in una coppia (posizioni ordinate, valori);
+    # ritorna il valore precedente, None se la chiave è nuova (0 può essere un rating valido)
+    @staticmethod
+    def _upsert(keys: List[np.ndarray], values: List[np.ndarray], at: int, key: int,
+                value: float) -> Optional[float]:
+        pos = np.searchsorted(keys[at], key)
+        if pos < len(keys[at]) and keys[at][pos] == key:
+            previous = float(values[at][pos])
+            values[at][pos] = value
+            return previous
+        keys[at] = np.insert(keys[at], pos, key)
+        values[at] = np.insert(values[at], pos, value)
+        return None
+
+    def set_rating(self, user_id: int, item_id: int, rating: float) -> Optional[float]:
+        """Add or update a rating, refreshing only the similarities of that user.
+
+        Returns the previous rating, or None if the rating is new.
+        """
+        row = self.user_index.get(user_id)
+        if row is None:
+            row = self._add_user(user_id)
+        col = self.item_index.get(item_id)
+        if col is None:
+            col = self._add_item(item_id)
+
+        previous = self._upsert(self._user_cols, self._user_values, row, col, rating)
+        self._upsert(self._item_rows, self._item_values, col, row, rating)
+
+        # aggiorno gli aggregati in O(1): un aggiornamento sostituisce il vecchio valore nella somma
+        if previous is None:
+            self._item_count[col] += 1
+            self._total_count += 1
+        delta = rating - (previous if previous is not None else 0.0)
+        self._item_sum[col] += delta
+        self._total_sum += delta
+        self._popular_order = None
+        self._entries = None
+
+        # la Pearson tra u e v dipende solo dai rating di u e v, quindi cambia solo la riga
+        # dell'utente che ha votato e, per simmetria, la sua posizione nelle altre righe in cache
+        sims, _ = self._compute_similarity_row(row)
+        for other in list(self._sim_cache):
+            self._cached_row(other)[row] = sims[other]
+        self._cache_put(row, sims)
+
+        return previous
+
+    # riga in cache, allungata con zeri se nel frattempo sono arrivati utenti nuovi
+    def _cached_row(self, row: int) -> np.ndarray:
+        sims = self._sim_cache[row]
+        if len(sims) < self.n_users:
+            sims = np.concatenate([sims, np.zeros(self.n_users - len(sims))])
+            self._sim_cache[row] = sims
+        return sims
+
+    def _cache_put(self, row: int, sims: np.ndarray):
+        self._sim_cache[row] = sims
+        self._sim_cache.move_to_end(row)
+        while len(self._sim_cache) > max(self.similarity_cache_size, 1):
+            self._sim_cache.popitem(last=False)
+
+    # calcolo la Pearson (normalizzata in [0, 1]) tra un utente e tutti gli altri in forma vettoriale:
+    # scorro solo le colonne degli item valutati dall'utente target e accumulo le somme per utente
+    def _compute_similarity_row(self, row: int) -> Tuple[np.ndarray, np.ndarray]:
+        cols = self._user_cols[row]
+        others = _concat([self._item_rows[c] for c in cols], np.int64)
+        y = _concat([self._item_values[c] for c in cols], float)
+        x = np.repeat(self._user_values[row], [len(self._item_rows[c]) for c in cols])
+
+        # numero di item in comune e medie di entrambi gli utenti calcolate sui soli item in comune
+        n = np.bincount(others, minlength=self.n_users)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_x = np.bincount(others, weights=x, minlength=self.n_users) / n
+            mean_y = np.bincount(others, weights=y, minlength=self.n_users) / n
+
+        # seconda passata sui valori centrati, come in calculate_user_similarity: la formula a una
+        # passata (sum_xx - sum_x^2 / n) introduce rumore che rompe i pari merito
+        dx = x - mean_x[others]
+        dy = y - mean_y[others]
+        numerator = np.bincount(others, weights=dx * dy, minlength=self.n_users)
+        denominator = np.sqrt(np.bincount(others, weights=dx ** 2, minlength=self.n_users)
+                              * np.bincount(others, weights=dy ** 2, minlength=self.n_users))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correlation = np.clip(numerator / denominator, -1.0, 1.0)
+
+        # stesse regole di calculate_user_similarity: almeno 2 item in comune e varianza non nulla
+        # arrotondo a 12 decimali così valori uguali a meno dell'ordine delle somme restano pari merito
+        valid = (n >= 2) & (denominator > 1e-12)
+        sims = np.round(np.where(valid, (correlation + 1) / 2, 0.0), ROUND_DECIMALS)
+        sims[row] = 0.0
+
+        return sims, n
+
+    def similarities(self, user_id: int) -> np.ndarray:
+        """Similarity of user_id with every user in the index (0 for itself)."""
+        row = self.user_index[user_id]
+        if row in self._sim_cache:
+            self._sim_cache.move_to_end(row)
+            return self._cached_row(row)
+        sims, _ = self._compute_similarity_row(row)
+        self._cache_put(row, sims)
+        return sims
+
+    def common_counts(self, user_id: int) -> np.ndarray:
+        """Number of items co-rated by user_id and every user in the index."""
+        cols = self._user_cols[self.user_index[user_id]]
+        others = _concat([self._item_rows[c] for c in cols], np.int64)
+        return np.bincount(others, minlength=self.n_users)
+
+    # vicini = utenti con similarità sopra la soglia, limitati ai k più simili se richiesto
+    @staticmethod
+    def _select_neighbors(sims: np.ndarray, k_neighbors: Optional[int], min_similarity: float) -> np.ndarray:
+        neighbors = np.flatnonzero(sims > min_similarity)
+        if k_neighbors is not None and len(neighbors) > k_neighbors:
+            top = np.argpartition(-sims[neighbors], k_neighbors - 1)[:k_neighbors]
+            neighbors = neighbors[top]
+        return neighbors
+
+    def _all_entries(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self._entries is None:
+            lengths = [len(rows) for rows in self._item_rows]
+            self._entries = (np.repeat(np.arange(self.n_items), lengths),
+                             _concat(self._item_rows, np.int64), _concat(self._item_values, float))
+        return self._entries
+
+    # somme pesate su tutti gli item: con pochi vicini scorro solo le loro righe,
+    # con tanti vicini una passata vettoriale su tutte le voci costa meno che raccogliere le righe
+    def _neighbor_sums(self, sims: np.ndarray, neighbors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if len(neighbors) * 8 > self.n_users:
+            cols, rows, values = self._all_entries()
+            weights = np.zeros(self.n_users)
+            weights[neighbors] = sims[neighbors]
+            weights = weights[rows]
+        else:
+            cols, values, weights = self._neighbor_entries(sims, neighbors)
+
+        weighted_sum = np.bincount(cols, weights=weights * values, minlength=self.n_items)
+        similarity_sum = np.bincount(cols, weights=weights, minlength=self.n_items)
+        return weighted_sum, similarity_sum
+
+    def _neighbor_entries(self, sims: np.ndarray, neighbors: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        cols = _concat([self._user_cols[v] for v in neighbors], np.int64)
+        values = _concat([self._user_values[v] for v in neighbors], float)
+        weights = np.repeat(sims[neighbors], [len(self._user_cols[v]) for v in neighbors])
+        return cols, values, weights
+
+    @staticmethod
+    def _divide(weighted_sum: np.ndarray, similarity_sum: np.ndarray) -> np.ndarray:
+        predictions = np.full(len(weighted_sum), np.nan)
+        np.divide(weighted_sum, similarity_sum, out=predictions, where=similarity_sum > 0)
+        return np.round(predictions, ROUND_DECIMALS)
+
+    def predict(self, user_id: int, items: Optional[np.ndarray] = None,
+                k_neighbors: Optional[int] = None, min_similarity: float = 0.0) -> np.ndarray:
+        """Similarity-weighted predictions for the given item columns (all items by default).
+
+        NaN where no neighbor rated the item.
+        """
+        sims = self.similarities(user_id)
+        neighbors = self._select_neighbors(sims, k_neighbors, min_similarity)
+        if items is None:
+            return self._divide(*self._neighbor_sums(sims, neighbors))
+
+        # pochi item richiesti (es. valutazione): scorro le loro colonne invece delle righe dei vicini
+        weights = np.zeros(self.n_users)
+        weights[neighbors] = sims[neighbors]
+        rows = _concat([self._item_rows[c] for c in items], np.int64)
+        values = _concat([self._item_values[c] for c in items], float)
+        positions = np.repeat(np.arange(len(items)), [len(self._item_rows[c]) for c in items])
+
+        weighted_sum = np.bincount(positions, weights=weights[rows] * values, minlength=len(items))
+        similarity_sum = np.bincount(positions, weights=weights[rows], minlength=len(items))
+        return self._divide(weighted_sum, similarity_sum)
+
+    def rated_mask(self, user_id: int) -> np.ndarray:
+        """Boolean mask of the items rated by user_id (all False for unknown users)."""
+        mask = np.zeros(self.n_items, dtype=bool)
+        row = self.user_index.get(user_id)
+        if row is not None:
+            mask[self._user_cols[row]] = True
+        return mask
+
+    def item_counts(self) -> np.ndarray:
+        return self._item_count[:self.n_items]
+
+    def global_mean(self) -> float:
+        return self._total_sum / self._total_count if self._total_count else 0.0
+
+    def popularity_scores(self) -> np.ndarray:
+        """Bayesian-shrunk mean rating per item: (C * global_mean + sum) / (C + count)."""
+        scores = ((POPULARITY_PRIOR_WEIGHT * self.global_mean() + self._item_sum[:self.n_items])
+                  / (POPULARITY_PRIOR_WEIGHT + self._item_count[:self.n_items]))
+        return np.round(scores, ROUND_DECIMALS)
+
+    def popular_items(self, user_id: int, top_n: int) -> List[Tuple[int, float, int]]:
+        """Top-N (item_id, score, count) by popularity score, skipping items rated by user_id."""
+        if self._popular_order is None:
+            scores = self.popularity_scores()
+            order = np.lexsort((np.array(self.item_ids), -scores))
+            self._popular_order = order[self.item_counts()[order] > 0]
+            self._popular_scores = scores
+
+        # scorro la classifica già ordinata saltando gli item dell'utente:
+        # mi fermo dopo top_n item, quindi una lettura costa O(top_n + item valutati)
+        row = self.user_index.get(user_id)
+        rated = set(self._user_cols[row].tolist()) if row is not None else set()
+        result = []
+        for col in self._popular_order:
+            if len(result) >= top_n:
+                break
+            if col not in rated:
+                result.append((self.item_ids[col], float(self._popular_scores[col]), int(self._item_count[col])))
+        return result
+
+    def recommend(self, user_id: int, top_n: int, k_neighbors: Optional[int] = None,
+                  min_similarity: float = 0.0) -> Tuple[List[Tuple[int, float]], str]:
+        """Top-N (item_id, score) for user_id and the strategy used ('collaborative' or 'popularity')."""
+        # un utente sconosciuto passa direttamente al fallback di popolarità
+        sims = self.similarities(user_id) if self.has_user(user_id) else np.zeros(0)
+        neighbors = self._select_neighbors(sims, k_neighbors, min_similarity)
+        if len(neighbors) > 0:
+            # candidati: unione degli item valutati dai vicini (peso > 0), esclusi quelli già valutati
+            # dall'utente; sono gli unici con una previsione, gli altri non vengono nemmeno divisi
+            weighted_sum, similarity_sum = self._neighbor_sums(sims, neighbors)
+            candidates = np.flatnonzero(similarity_sum > 0)
+            candidates = candidates[~self.rated_mask(user_id)[candidates]]
+            predictions = self._divide(weighted_sum[candidates], similarity_sum[candidates])
+            item_ids = np.array([self.item_ids[c] for c in candidates], dtype=np.int64)
+
+            # Ordino per previsione decrescente (a parità per item_id) e prendo i top N
+            order = np.lexsort((item_ids, -predictions))[:top_n]
+            if len(order) > 0:
+                return [(int(i), float(p)) for i, p in zip(item_ids[order], predictions[order])], 'collaborative'
+
+        # cold start (utente nuovo o senza vicini): uso la classifica di popolarità precalcolata
+        return [(item, score) for item, score, _ in self.popular_items(user_id, top_n)], 'popularity'
@@ -0,0 +1,155 @@
+"""
+Controllo di regressione dell'indice incrementale
+Confronta RatingIndex con calculate_user_similarity, con il log di ratings.csv (vale l'ultima riga)
+e con un indice ricostruito da zero dopo scritture casuali; controlla anche lo split di evaluate.py
+"""
+import argparse
+import logging
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from cf_index import RatingIndex
+from evaluate import load_ratings, train_test_split
+from recommender_server import calculate_user_similarity
+
+DATA_PATH = Path(__file__).parent.parent / "data" / "ratings.csv"
+TOLERANCE = 1e-9
+
+
+# similarità dell'indice in ordine di user_id, per confrontare indici con mappe diverse
+def similarity_by_user(index: RatingIndex, user_id: int, user_ids: list) -> np.ndarray:
+    sims = index.similarities(user_id)
+    return np.array([sims[index.user_index[u]] for u in user_ids])
+
+
+def check_similarities(ratings: pd.DataFrame) -> list:
+    """Compare every similarity row with calculate_user_similarity on the pivoted matrix."""
+    index = RatingIndex(ratings)
+    # pivot_table farebbe la media dei duplicati: come l'indice tengo l'ultima riga per coppia
+    latest = ratings.drop_duplicates(['user_id', 'item_id'], keep='last')
+    matrix = latest.pivot_table(index='user_id', columns='item_id', values='rating')
+    user_ids = list(matrix.index)
+
+    failures = []
+    for u in user_ids:
+        expected = np.array([
+            0.0 if u == v else calculate_user_similarity(matrix.loc[u], matrix.loc[v]) for v in user_ids
+        ])
+        diff = np.abs(similarity_by_user(index, u, user_ids) - expected).max()
+        if diff > TOLERANCE:
+            failures.append(f"similarities user {u}: max diff {diff:.2e}")
+    return failures
+
+
+def check_incremental(ratings: pd.DataFrame, n_writes: int, seed: int) -> list:
+    """Apply random writes in place and compare with an index rebuilt from the final ratings."""
+    rng = random.Random(seed)
+    index = RatingIndex(ratings)
+    user_ids = [int(u) for u in ratings['user_id'].unique()]
+    item_ids = [int(i) for i in ratings['item_id'].unique()]
+
+    # scritture casuali: aggiornamenti, rating nuovi e qualche utente/item mai visto;
+    # intanto leggo righe a caso così anche le righe in cache devono restare allineate
+    writes = []
+    for k in range(n_writes):
+        user_id = rng.choice(user_ids) if rng.random() < 0.9 else max(user_ids) + 1 + k
+        item_id = rng.choice(item_ids) if rng.random() < 0.95 else max(item_ids) + 1 + k
+        rating = float(rng.randint(1, 5))
+        index.similarities(rng.choice(user_ids))
+        index.set_rating(user_id, item_id, rating)
+        writes.append((user_id, item_id, rating))
+
+    final = pd.concat([ratings, pd.DataFrame(writes, columns=['user_id', 'item_id', 'rating'])])
+    rebuilt = RatingIndex(final.drop_duplicates(['user_id', 'item_id'], keep='last'))
+    all_users = sorted(rebuilt.user_ids)
+
+    failures = []
+    for u in all_users:
+        diff = np.abs(similarity_by_user(index, u, all_users) - similarity_by_user(rebuilt, u, all_users)).max()
+        if diff > TOLERANCE:
+            failures.append(f"incremental similarities user {u}: max diff {diff:.2e}")
+        if index.recommend(u, 10) != rebuilt.recommend(u, 10):
+            failures.append(f"incremental recommendations user {u} differ")
+    if index.popular_items(-1, 10) != rebuilt.popular_items(-1, 10):
+        failures.append("incremental popularity ranking differs")
+    return failures
+
+
+# log come lo scrive add_rating: dopo i rating originali accodo degli aggiornamenti per le stesse coppie
+def append_updates(ratings: pd.DataFrame, n_updates: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    updates = ratings.iloc[rng.choice(len(ratings), size=min(n_updates, len(ratings)), replace=False)].copy()
+    updates['rating'] = rng.integers(1, 6, size=len(updates)).astype(float)
+    return pd.concat([ratings, updates], ignore_index=True)
+
+
+def check_log_duplicates(ratings: pd.DataFrame, seed: int) -> list:
+    """Load a log with duplicate (user, item) pairs and check that the last row wins."""
+    log = append_updates(ratings, len(ratings) // 5, seed)
+    index = RatingIndex(log)
+
+    failures = []
+    expected = log.drop_duplicates(['user_id', 'item_id'], keep='last')
+    for user_id, user_log in expected.groupby('user_id'):
+        item_ids, values = index.user_ratings(int(user_id))
+        user_log = user_log.sort_values('item_id')
+        if not (np.array_equal(item_ids, user_log['item_id'].to_numpy())
+                and np.array_equal(values, user_log['rating'].to_numpy(dtype=float))):
+            failures.append(f"log duplicates user {user_id}: ratings differ from the last log rows")
+    return failures
+
+
+def check_evaluation_split(ratings: pd.DataFrame, seed: int) -> list:
+    """Split a log with duplicate pairs the way evaluate.py does and check that no pair leaks into both sides."""
+    log = append_updates(ratings, len(ratings) // 5, seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "ratings.csv"
+        log.to_csv(path, index=False)
+        loaded = load_ratings(path)
+    train, test = train_test_split(loaded, seed=seed)
+
+    failures = []
+    leaked = train.merge(test, on=['user_id', 'item_id'])
+    if len(leaked) > 0:
+        failures.append(f"evaluation split: {len(leaked)} (user, item) pairs in both train and test")
+    latest = log.drop_duplicates(['user_id', 'item_id'], keep='last')
+    merged = pd.concat([train, test]).merge(latest, on=['user_id', 'item_id'], suffixes=('', '_last'))
+    if len(merged) != len(latest) or not np.array_equal(merged['rating'], merged['rating_last']):
+        failures.append("evaluation split: ratings differ from the last log rows")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Controllo di regressione dell'indice incrementale")
+    parser.add_argument("--ratings", type=Path, default=DATA_PATH, help="CSV con colonne user_id,item_id,rating")
+    parser.add_argument("--writes", type=int, default=500, help="numero di scritture casuali da applicare")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    ratings = pd.read_csv(args.ratings)
+
+    failures = check_similarities(ratings)
+    print(f"[CHECK] Similarità vs calculate_user_similarity: {'OK' if not failures else 'FAIL'}")
+    duplicates = check_log_duplicates(ratings, args.seed)
+    print(f"[CHECK] Log con coppie duplicate (vale l'ultima riga): {'OK' if not duplicates else 'FAIL'}")
+    split = check_evaluation_split(ratings, args.seed)
+    print(f"[CHECK] Split di evaluate.py senza coppie ripetute tra train e test: {'OK' if not split else 'FAIL'}")
+    incremental = check_incremental(ratings, args.writes, args.seed)
+    print(f"[CHECK] Indice incrementale vs ricostruito ({args.writes} scritture): {'OK' if not incremental else 'FAIL'}")
+
+    failures += duplicates + split + incremental
+    for failure in failures:
+        print(f"  - {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Valutazione offline del Recommender System
+Split train/test di ratings.csv, RMSE/MAE e Precision/Recall/NDCG@K per ogni configurazione,
+con tempo di esecuzione e picco di memoria, usando lo stesso motore di get_recommendations
+"""
+import argparse
+import itertools
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from cf_index import RatingIndex
+
+DATA_PATH = Path(__file__).parent.parent / "data" / "ratings.csv"
+
+
+def load_ratings(path: Path) -> pd.DataFrame:
+    """Read a ratings log, keeping only the last row per (user, item) pair."""
+    # add_rating accoda anche gli aggiornamenti: senza deduplicare, una coppia e il suo aggiornamento
+    # potrebbero finire una nel train e l'altra nel test
+    ratings = pd.read_csv(path)
+    return ratings.drop_duplicates(['user_id', 'item_id'], keep='last').reset_index(drop=True)
+
+
+def train_test_split(ratings: pd.DataFrame, test_ratio: float = 0.2, seed: int = 42):
+    """Per-user holdout: each user keeps at least one rating in train."""
+    rng = np.random.default_rng(seed)
+    shuffled = ratings.iloc[rng.permutation(len(ratings))].reset_index(drop=True)
+
+    # posizione di ogni rating (in ordine casuale) tra quelli dello stesso utente
+    position = shuffled.groupby('user_id').cumcount().to_numpy()
+    user_count = shuffled.groupby('user_id')['rating'].transform('size').to_numpy()
+    n_test = np.minimum(np.floor(user_count * test_ratio), user_count - 1)
+
+    is_test = position < n_test
+    return shuffled[~is_test].reset_index(drop=True), shuffled[is_test].reset_index(drop=True)
+
+
+# per ogni utente del test set predico i rating held-out e calcolo il top-K con lo stesso motore
+# del tool get_recommendations; le due chiamate consecutive riusano la stessa riga di similarità.
+# Dove il CF non ha una previsione uso lo score di popolarità (come fa il server), o la media globale
+def predict_test_set(index: RatingIndex, test: pd.DataFrame, user_ids: np.ndarray, model: str, k: int,
+                     k_neighbors, min_similarity: float):
+    n = len(test)
+    predictions = np.full(n, np.nan)
+    from_cf = np.zeros(n, dtype=bool)
+    recommended = np.full((len(user_ids), k), -1, dtype=np.int64)
+
+    popularity = index.popularity_scores()
+    cols = test['item_id'].map(index.item_index)
+    known_item = cols.notna().to_numpy()
+    cols = cols.fillna(-1).astype(int).to_numpy()
+
+    predictions[known_item] = popularity[cols[known_item]]
+    predictions[~known_item] = index.global_mean()
+
+    test_positions = test.groupby('user_id').indices
+    for i, user_id in enumerate(user_ids):
+        user_id = int(user_id)
+        if model == 'popularity':
+            items = [(item, score) for item, score, _ in index.popular_items(user_id, k)]
+        else:
+            positions = test_positions[user_id]
+            positions = positions[known_item[positions]]
+            if len(positions) > 0 and index.has_user(user_id):
+                cf = index.predict(user_id, cols[positions], k_neighbors, min_similarity)
+                found = ~np.isnan(cf)
+                predictions[positions[found]] = cf[found]
+                from_cf[positions[found]] = True
+            items, _ = index.recommend(user_id, k, k_neighbors, min_similarity)
+        recommended[i, :len(items)] = [item for item, _ in items]
+
+    return predictions, from_cf, recommended
+
+
+def ranking_metrics(recommended: np.ndarray, relevant: pd.DataFrame, user_ids: np.ndarray, k: int):
+    """Precision/Recall/NDCG@K from a (n_users x k) matrix of item ids (-1 = empty slot).
+
+    NaN when no test user has a relevant item (e.g. threshold above every held-out rating).
+    """
+    if len(relevant) == 0:
+        return {'precision': float('nan'), 'recall': float('nan'), 'ndcg': float('nan')}
+
+    # codifico le coppie (utente, item) come un intero per confrontarle con np.isin
+    item_span = int(max(recommended.max(), relevant['item_id'].max())) + 2
+    user_pos = {u: i for i, u in enumerate(user_ids)}
+    relevant_keys = relevant['user_id'].map(user_pos).to_numpy() * item_span + relevant['item_id'].to_numpy()
+
+    rec_keys = np.arange(len(user_ids))[:, None] * item_span + recommended
+    hits = np.isin(rec_keys, relevant_keys) & (recommended >= 0)
+
+    n_relevant = relevant.groupby('user_id').size().reindex(user_ids, fill_value=0).to_numpy()
+    has_relevant = n_relevant > 0
+    hits, n_relevant = hits[has_relevant], n_relevant[has_relevant]
+
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    dcg = (hits * discounts).sum(axis=1)
+    ideal = np.cumsum(discounts)[np.minimum(n_relevant, k) - 1]
+
+    return {
+        'precision': float((hits.sum(axis=1) / k).mean()),
+        'recall': float((hits.sum(axis=1) / n_relevant).mean()),
+        'ndcg': float((dcg / ideal).mean())
+    }
+
+
+def _run_config(train: pd.DataFrame, test: pd.DataFrame, model: str, k: int,
+                k_neighbors, min_similarity: float, relevance_threshold: float) -> dict:
+    start = time.perf_counter()
+
+    # basta una riga di similarità in cache: ogni utente viene visitato una sola volta
+    index = RatingIndex(train, similarity_cache_size=1)
+    fit_time = time.perf_counter() - start
+
+    # rating predetti per RMSE/MAE e matrice dei top-K per le metriche di ranking
+    user_ids = np.sort(test['user_id'].unique())
+    predictions, from_cf, recommended = predict_test_set(
+        index, test, user_ids, model, k, k_neighbors, min_similarity
+    )
+    errors = predictions - test['rating'].to_numpy()
+
+    relevant = test[test['rating'] >= relevance_threshold]
+    ranking = ranking_metrics(recommended, relevant, user_ids, k)
+
+    total_time = time.perf_counter() - start
+
+    return {
+        'model': model,
+        'k_neighbors': '-' if model == 'popularity' else (k_neighbors or 'all'),
+        'min_similarity': min_similarity,
+        'rmse': float(np.sqrt(np.mean(errors ** 2))),
+        'mae': float(np.mean(np.abs(errors))),
+        'coverage': float(from_cf.mean()),
+        f'precision@{k}': ranking['precision'],
+        f'recall@{k}': ranking['recall'],
+        f'ndcg@{k}': ranking['ndcg'],
+        'fit_s': fit_time,
+        'total_s': total_time,
+        'ms_per_user': 1000 * (total_time - fit_time) / max(len(user_ids), 1)
+    }
+
+
+def evaluate_config(train: pd.DataFrame, test: pd.DataFrame, model: str = 'user_cf', k: int = 10,
+                    k_neighbors=None, min_similarity: float = 0.0, relevance_threshold: float = 4.0,
+                    measure_memory: bool = True) -> dict:
+    """Fit on train, score test; returns accuracy, ranking metrics, wall time and peak memory."""
+    args = (train, test, model, k, k_neighbors, min_similarity, relevance_threshold)
+
+    # tracemalloc rallenta ogni allocazione (fino a ~3x sui vicinati densi), quindi tempi e
+    # metriche vengono da una passata senza tracciamento e il picco di memoria da una seconda passata
+    result = _run_config(*args)
+    result['peak_mb'] = float('nan')
+    if measure_memory:
+        tracemalloc.start()
+        _run_config(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['peak_mb'] = peak / 2 ** 20
+
+    return result
+
+
+def parse_neighbors(value: str):
+    return [None if v.strip() in ('all', '0') else int(v) for v in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Valutazione offline del Recommender System")
+    parser.add_argument("--ratings", type=Path, default=DATA_PATH, help="CSV con colonne user_id,item_id,rating")
+    parser.add_argument("--models", default="user_cf,popularity", help="modelli da valutare: user_cf, popularity")
+    parser.add_argument("--neighbors", default="all,10,5", help="numero di vicini K da provare ('all' = tutti)")
+    parser.add_argument("--min-similarity", default="0.0,0.5", help="soglie di similarità da provare")
+    parser.add_argument("--k", type=int, default=10, help="cutoff per Precision/Recall/NDCG")
+    parser.add_argument("--relevance", type=float, default=4.0, help="rating minimo per considerare un item rilevante")
+    parser.add_argument("--test-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-memory", action="store_true",
+                        help="salta la seconda passata con tracemalloc (picco di memoria non misurato)")
+    parser.add_argument("--output", type=Path, help="salva i risultati anche in CSV")
+    args = parser.parse_args()
+
+    ratings = load_ratings(args.ratings)
+    train, test = train_test_split(ratings, args.test_ratio, args.seed)
+    print(f"[EVAL] {len(ratings)} ratings -> train {len(train)}, test {len(test)}")
+    if len(test) == 0:
+        raise ValueError("Empty test set: increase --test-ratio or use more ratings per user")
+
+    # griglia di configurazioni: il modello di popolarità non dipende da K e soglia
+    configs = []
+    for model in args.models.split(","):
+        if model == 'user_cf':
+            grid = itertools.product(parse_neighbors(args.neighbors),
+                                     [float(s) for s in args.min_similarity.split(",")])
+            configs.extend(('user_cf', kn, ms) for kn, ms in grid)
+        elif model == 'popularity':
+            configs.append(('popularity', None, 0.0))
+        else:
+            raise ValueError(f"Unknown model: {model}")
+
+    results = []
+    for model, k_neighbors, min_similarity in configs:
+        results.append(evaluate_config(train, test, model, args.k, k_neighbors, min_similarity,
+                                       args.relevance, not args.no_memory))
+
+    report = pd.DataFrame(results)
+    with pd.option_context('display.width', 200, 'display.max_columns', None, 'display.float_format', '{:.4f}'.format):
+        print(report.to_string(index=False))
+
+    if args.output:
+        report.to_csv(args.output, index=False)
+        print(f"\n[EVAL] Risultati salvati in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
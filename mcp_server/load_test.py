@@ -0,0 +1,218 @@
+"""
+Load Test MCP Recommender System
+Genera traffico concorrente verso il server MCP passando dal vero protocollo stdio
+"""
+import argparse
+import asyncio
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+SERVER_PATH = Path(__file__).parent / "recommender_server.py"
+DATA_DIR = Path(__file__).parent.parent / "data"
+
+# mix di default, pensato per assomigliare al traffico di un assistente (tante letture, poche scritture)
+DEFAULT_MIX = "get_recommendations=0.5,get_similar_users=0.2,get_user_stats=0.2,add_rating=0.1"
+TOOLS = ["get_recommendations", "get_similar_users", "get_user_stats", "add_rating"]
+
+
+def parse_mix(mix: str) -> dict:
+    """Parse a 'tool=weight,...' string into a normalized weight dict."""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in TOOLS:
+            raise ValueError(f"Unknown tool in mix: {name}")
+        weights[name] = float(weight)
+
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("Mix weights must sum to a positive value")
+    return {name: w / total for name, w in weights.items()}
+
+
+# costruisco gli argomenti di una chiamata in base al tool estratto
+def make_arguments(tool: str, user_ids: list, item_ids: list, rng: random.Random) -> dict:
+    user_id = rng.choice(user_ids)
+    if tool == "get_recommendations" or tool == "get_similar_users":
+        return {"user_id": user_id, "top_n": 5}
+    if tool == "get_user_stats":
+        return {"user_id": user_id}
+    return {
+        "user_id": user_id,
+        "item_id": rng.choice(item_ids),
+        "rating": rng.choice([1.0, 2.0, 3.0, 4.0, 5.0])
+    }
+
+
+# il server non solleva eccezioni ma ritorna stringhe "Error: ...", quindi le conto come errori
+def is_error(result) -> bool:
+    if result.isError:
+        return True
+    text = result.content[0].text if result.content else ""
+    return text.startswith("Error")
+
+
+async def run_session(schedule: list, data_dir: Path, ready: asyncio.Event, start: asyncio.Future, samples: list):
+    """Open one stdio MCP session and fire its share of the scheduled requests."""
+    server_params = StdioServerParameters(
+        command=sys.executable,
+        args=[str(SERVER_PATH)],
+        env={"RECOMMENDER_DATA_DIR": str(data_dir)}
+    )
+
+    async with stdio_client(server_params) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+
+            # aspetto che tutte le sessioni siano pronte, così l'avvio dei server non entra nelle misure
+            ready.set()
+            t0 = await start
+
+            async def fire(offset: float, tool: str, arguments: dict):
+                # la latenza parte dall'istante pianificato, non da quello di invio:
+                # se il server rallenta, il ritardo accumulato finisce nei percentili
+                scheduled = t0 + offset
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                try:
+                    result = await session.call_tool(tool, arguments)
+                    error = is_error(result)
+                except Exception:
+                    error = True
+                samples.append((tool, time.perf_counter() - scheduled, error))
+
+            # ogni richiesta è un task separato, così una sessione può avere più chiamate in volo
+            await asyncio.gather(*(fire(offset, tool, args) for offset, tool, args in schedule))
+
+
+def print_report(samples: list, elapsed: float):
+    print("\n" + "=" * 78)
+    print(f"  {'tool':<22}{'count':>7}{'err %':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    print("-" * 78)
+
+    groups = {tool: [s for s in samples if s[0] == tool] for tool in TOOLS}
+    groups["TOTAL"] = samples
+
+    for name, rows in groups.items():
+        if not rows:
+            continue
+        latencies = np.array([r[1] for r in rows]) * 1000
+        errors = sum(1 for r in rows if r[2])
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(f"  {name:<22}{len(rows):>7}{100 * errors / len(rows):>8.1f}"
+              f"{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}{latencies.mean():>10.1f}")
+
+    print("-" * 78)
+    print(f"  Durata: {elapsed:.1f}s  -  Throughput: {len(samples) / elapsed:.1f} req/s")
+    print("=" * 78 + "\n")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Load test del server MCP Recommender System")
+    parser.add_argument("--sessions", type=int, default=4, help="sessioni MCP concorrenti (un processo server ciascuna)")
+    parser.add_argument("--rate", type=float, default=20.0, help="richieste al secondo totali")
+    parser.add_argument("--duration", type=float, default=30.0, help="durata del test in secondi")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="pesi dei tool, es. get_recommendations=0.5,add_rating=0.1")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--in-place", action="store_true",
+                        help="usa direttamente data/ invece di una copia (add_rating modifica ratings.csv); solo con --sessions 1")
+    args = parser.parse_args()
+
+    if args.sessions < 1:
+        parser.error("--sessions must be at least 1")
+    if args.rate <= 0 or args.duration <= 0:
+        parser.error("--rate and --duration must be positive")
+    if int(args.rate * args.duration) < 1:
+        parser.error("--rate x --duration must schedule at least one request")
+    # con più sessioni in place, più processi server accoderebbero e compatterebbero all'avvio
+    # lo stesso ratings.csv in contemporanea
+    if args.in_place and args.sessions > 1:
+        parser.error("--in-place requires --sessions 1 (server processes would write the same ratings.csv)")
+
+    mix = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+
+    ratings = pd.read_csv(DATA_DIR / "ratings.csv")
+    user_ids = sorted(int(u) for u in ratings['user_id'].unique())
+    item_ids = sorted(int(i) for i in ratings['item_id'].unique())
+
+    # pianifico tutte le richieste in anticipo (arrivi a rate costante, open loop)
+    # e le distribuisco round-robin tra le sessioni
+    n_requests = int(args.rate * args.duration)
+    tools = rng.choices(list(mix.keys()), weights=list(mix.values()), k=n_requests)
+    schedules = [[] for _ in range(args.sessions)]
+    for k, tool in enumerate(tools):
+        schedules[k % args.sessions].append((k / args.rate, tool, make_arguments(tool, user_ids, item_ids, rng)))
+
+    # ogni sessione lavora su una copia dei dati, così add_rating non tocca il dataset originale
+    # e i processi server non si sovrascrivono a vicenda ratings.csv
+    tmp_root = None
+    if args.in_place:
+        data_dirs = [DATA_DIR] * args.sessions
+    else:
+        tmp_root = Path(tempfile.mkdtemp(prefix="recommender_load_"))
+        data_dirs = []
+        for i in range(args.sessions):
+            session_dir = tmp_root / f"session_{i}"
+            shutil.copytree(DATA_DIR, session_dir)
+            data_dirs.append(session_dir)
+
+    print(f"[LOAD] {args.sessions} sessioni, {args.rate} req/s, {args.duration}s, {n_requests} richieste")
+    print(f"[LOAD] Mix: {', '.join(f'{t}={w:.2f}' for t, w in mix.items())}")
+
+    samples = []
+    ready = [asyncio.Event() for _ in range(args.sessions)]
+    start = asyncio.get_running_loop().create_future()
+    tasks = []
+    try:
+        tasks = [
+            asyncio.create_task(run_session(schedules[i], data_dirs[i], ready[i], start, samples))
+            for i in range(args.sessions)
+        ]
+
+        # aspetto insieme le sessioni e gli eventi di "pronto": se un server muore prima di
+        # initialize() la sua sessione termina con un'eccezione invece di lasciarci in attesa
+        all_ready = asyncio.ensure_future(asyncio.gather(*(event.wait() for event in ready)))
+        await asyncio.wait([all_ready, *tasks], return_when=asyncio.FIRST_COMPLETED)
+        failed = [task for task in tasks if task.done()]
+        if failed:
+            all_ready.cancel()
+            await asyncio.gather(all_ready, return_exceptions=True)
+            error = failed[0].exception()
+            # il client stdio avvolge l'errore in uno o più ExceptionGroup: riporto quello originale
+            while isinstance(error, BaseExceptionGroup):
+                error = error.exceptions[0]
+            raise RuntimeError(f"Sessione MCP terminata durante l'avvio: {error!r}") from error
+
+        t0 = time.perf_counter()
+        start.set_result(t0)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - t0
+    finally:
+        # chiudo le sessioni ancora aperte (es. dopo un errore di avvio) prima di cancellare i dati
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if tmp_root is not None:
+            shutil.rmtree(tmp_root, ignore_errors=True)
+
+    print_report(samples, elapsed)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except RuntimeError as e:
+        print(f"[ERROR] Errore: {e}")
+        sys.exit(1)
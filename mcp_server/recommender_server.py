@@ -3,12 +3,15 @@ MCP Server for Recommender Systems - Collaborative Filtering
 """
 
 from typing import Any, List, Dict
+import os
 import pandas as pd
 import numpy as np
 from pathlib import Path
 from mcp.server.fastmcp import FastMCP
 import logging
 
+from cf_index import RatingIndex
+
 # Inizializazzione FastMCP server
 mcp = FastMCP("recommender-systems")
 
@@ -21,20 +24,33 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # variabili globali per i dati
-ratings_df: pd.DataFrame = None
 movies_df: pd.DataFrame = None
-DATA_PATH = Path(__file__).parent.parent / "data" / "ratings.csv"
-MOVIES_PATH = Path(__file__).parent.parent / "data" / "movies.csv"
+# indice utente-item con le similarità, aggiornato in modo incrementale da add_rating
+rating_index: RatingIndex = None
+# la cartella dei dati si può sovrascrivere con RECOMMENDER_DATA_DIR (es. per il load test su una copia)
+DATA_DIR = Path(os.environ.get("RECOMMENDER_DATA_DIR", Path(__file__).parent.parent / "data"))
+DATA_PATH = DATA_DIR / "ratings.csv"
+MOVIES_PATH = DATA_DIR / "movies.csv"
 
 
 def load_or_initialize_data():
     """Load ratings data or initialize with sample data."""
-    global ratings_df, movies_df
+    global movies_df, rating_index
     
     try:
         if DATA_PATH.exists():
             ratings_df = pd.read_csv(DATA_PATH)
             logger.info(f"Loaded {len(ratings_df)} ratings from {DATA_PATH}")
+            
+            # add_rating accoda anche gli aggiornamenti, quindi per ogni coppia vale l'ultima riga:
+            # all'avvio compatto il file così le righe superate non si accumulano
+            latest = ratings_df.drop_duplicates(['user_id', 'item_id'], keep='last')
+            if len(latest) < len(ratings_df):
+                latest.to_csv(DATA_PATH, index=False)
+                logger.info(f"Compacted {DATA_PATH} to {len(latest)} ratings")
+            
+            # i dati restano solo nell'indice, il DataFrame serve solo per costruirlo
+            rating_index = RatingIndex(latest)
         
         # carico anche i dati dei film se disponibili
         if MOVIES_PATH.exists():
@@ -92,80 +108,17 @@ def calculate_user_similarity(user1_ratings: pd.Series, user2_ratings: pd.Series
 async def get_recommendations(user_id: int, top_n: int = 5) -> str:
 
     try:
-        if ratings_df is None:
+        if rating_index is None:
             return "Error: Data not loaded. Please initialize the system first."
         
-        # prendo le valutazioni dell'utente target
-        user_ratings = ratings_df[ratings_df['user_id'] == user_id]
-        
-        if len(user_ratings) == 0:
-            return f"Error: User {user_id} not found in the system."
-        
-        # Prendo tutti gli item valutati dall'utente target
-        rated_items = set(user_ratings['item_id'].values)
-        
-        # Creo la matrice utente-item per il calcolo della similarità
-        user_item_matrix = ratings_df.pivot_table(
-            index='user_id', 
-            columns='item_id', 
-            values='rating'
-        )
-        
-        # Prendo le valutazioni dell'utente target come Series
-        target_user_ratings = user_item_matrix.loc[user_id]
-        
-        # Calcolo le similarità con tutti gli altri utenti
-        similarities = {}
-        for other_user in user_item_matrix.index:
-            if other_user != user_id:
-                other_user_ratings = user_item_matrix.loc[other_user]
-                sim = calculate_user_similarity(target_user_ratings, other_user_ratings)
-                if sim > 0:
-                    similarities[other_user] = sim
-        
-        if not similarities:
-            return "No similar users found to generate recommendations."
-        
-        # Genero le previsioni per gli item non valutati   
-        predictions = {}
-        all_items = set(ratings_df['item_id'].unique())
-        unrated_items = all_items - rated_items
-        
-        for item in unrated_items:
-            # Prendo le valutazioni dagli utenti simili per questo item
-            item_ratings = ratings_df[
-                (ratings_df['item_id'] == item) & 
-                (ratings_df['user_id'].isin(similarities.keys()))
-            ]
-            
-            if len(item_ratings) == 0:
-                continue
-            
-            # Media pesata usando i punteggi di similarità
-            weighted_sum = 0.0
-            similarity_sum = 0.0
-            
-            for _, row in item_ratings.iterrows():
-                other_user = row['user_id']
-                rating = row['rating']
-                sim = similarities[other_user]
-                
-                weighted_sum += rating * sim
-                similarity_sum += sim
-            
-            if similarity_sum > 0:
-                predictions[item] = weighted_sum / similarity_sum
-        
-        # Ordino e prendo i top N
-        sorted_predictions = sorted(
-            predictions.items(), 
-            key=lambda x: x[1], 
-            reverse=True
-        )[:top_n]
+        # raccomandazioni dall'indice: collaborative filtering sui vicini,
+        # oppure classifica di popolarità per utenti nuovi o senza vicini (cold start)
+        sorted_predictions, strategy = rating_index.recommend(user_id, top_n)
         
         # formatto il risultato come JSON string
         result = {
             'user_id': user_id,
+            'strategy': strategy,
             'recommendations': []
         }
         
@@ -195,42 +148,31 @@ async def get_recommendations(user_id: int, top_n: int = 5) -> str:
 @mcp.tool()
 async def add_rating(user_id: int, item_id: int, rating: float) -> str:
     
-    global ratings_df
-    
     try:
-        if ratings_df is None:
+        if rating_index is None:
             return "Error: Data not loaded."
         
         # Valido il rating
         if not (1.0 <= rating <= 5.0):
             return "Error: Rating must be between 1 and 5."
         
-        # Controllo se il rating esiste già
-        existing = ratings_df[
-            (ratings_df['user_id'] == user_id) & 
-            (ratings_df['item_id'] == item_id)
-        ]
+        # aggiorno l'indice in place: nuovi utenti/item estendono le mappe
+        # e vengono ricalcolate solo le similarità dell'utente che ha votato
+        previous = rating_index.set_rating(user_id, item_id, rating)
         
-        if len(existing) > 0:
-            # Aggiorno il rating esistente
-            ratings_df.loc[
-                (ratings_df['user_id'] == user_id) & 
-                (ratings_df['item_id'] == item_id),
-                'rating'
-            ] = rating
+        if previous is not None:
             message = f"Updated rating: User {user_id} rated Item {item_id} as {rating}"
         else:
-            # Aggiungo un nuovo rating
-            new_rating = pd.DataFrame({
-                'user_id': [user_id],
-                'item_id': [item_id],
-                'rating': [rating]
-            })
-            ratings_df = pd.concat([ratings_df, new_rating], ignore_index=True)
             message = f"Added rating: User {user_id} rated Item {item_id} as {rating}"
         
-        # Save to file\
-        ratings_df.to_csv(DATA_PATH, index=False)
+        # Save to file: sia i rating nuovi sia gli aggiornamenti si accodano (vale l'ultima riga),
+        # così una scrittura costa O(1) invece di riscrivere tutto il file
+        new_rating = pd.DataFrame({
+            'user_id': [user_id],
+            'item_id': [item_id],
+            'rating': [rating]
+        })
+        new_rating.to_csv(DATA_PATH, mode='a', header=not DATA_PATH.exists(), index=False)
         logger.info(message)
         
         return message
@@ -246,36 +188,21 @@ async def add_rating(user_id: int, item_id: int, rating: float) -> str:
 async def get_similar_users(user_id: int, top_n: int = 5) -> str:
 
     try:
-        if ratings_df is None:
+        if rating_index is None:
             return "Error: Data not loaded."
         
-        # Creo la matrice utente-elemento
-        user_item_matrix = ratings_df.pivot_table(
-            index='user_id',
-            columns='item_id',
-            values='rating'
-        )
-        
-        if user_id not in user_item_matrix.index:
+        if not rating_index.has_user(user_id):
             return f"Error: User {user_id} not found."
         
-        # Prendo le valutazioni dell'utente target
-        target_user_ratings = user_item_matrix.loc[user_id]
-        
-        # Calcolo le similarità
-        similarities = []
-        for other_user in user_item_matrix.index:
-            if other_user != user_id:
-                other_user_ratings = user_item_matrix.loc[other_user]
-                sim = calculate_user_similarity(target_user_ratings, other_user_ratings)
-                if sim > 0:
-                    # Conto gli elementi comuni (entrambi valutati)
-                    common_items = (~target_user_ratings.isna() & ~other_user_ratings.isna()).sum()
-                    similarities.append((other_user, sim, common_items))
+        # Prendo le similarità dall'indice e il numero di item in comune
+        similarities = rating_index.similarities(user_id)
+        common_items = rating_index.common_counts(user_id)
+        user_ids = np.array(rating_index.user_ids)
         
-        # Ordino e prendo i primi N
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        top_similar = similarities[:top_n]
+        # Ordino per similarità decrescente (a parità per user_id) e prendo i primi N
+        similar = np.flatnonzero(similarities > 0)
+        order = similar[np.lexsort((user_ids[similar], -similarities[similar]))][:top_n]
+        top_similar = zip(user_ids[order], similarities[order], common_items[order])
         
         result = {
             'user_id': user_id,
@@ -301,21 +228,22 @@ async def get_similar_users(user_id: int, top_n: int = 5) -> str:
 async def get_user_stats(user_id: int) -> str:
 
     try:
-        if ratings_df is None:
+        if rating_index is None:
             return "Error: Data not loaded."
         
-        user_ratings = ratings_df[ratings_df['user_id'] == user_id]
+        # i rating dell'utente vengono dall'indice, senza scansionare tutta la tabella
+        rated_items, ratings = rating_index.user_ratings(user_id)
         
-        if len(user_ratings) == 0:
+        if len(ratings) == 0:
             return f"Error: User {user_id} has no ratings."
         
         stats = {
             'user_id': user_id,
-            'total_ratings': int(len(user_ratings)),
-            'average_rating': float(user_ratings['rating'].mean()),
-            'min_rating': float(user_ratings['rating'].min()),
-            'max_rating': float(user_ratings['rating'].max()),
-            'rated_items': user_ratings['item_id'].tolist()
+            'total_ratings': int(len(ratings)),
+            'average_rating': float(ratings.mean()),
+            'min_rating': float(ratings.min()),
+            'max_rating': float(ratings.max()),
+            'rated_items': rated_items.tolist()
         }
         
         return str(stats)